@@ -22,6 +22,8 @@ import shutil
 import os
 import json
 
+from concurrent.futures import ThreadPoolExecutor
+
 default_config = {
     "project_dir": r"Path\to\project",
     "frame_start": 0,
@@ -31,46 +33,32 @@ default_config = {
     "FOV": 60,
 }
 
+# number of label files collected before they are handed to the writer thread
+LABELS_FLUSH_SIZE = 64
 
-class Box:
-    dim_x = 1
-    dim_y = 1
-
-    def __init__(self, min_x, min_y, max_x, max_y, dim_x=dim_x, dim_y=dim_y):
-        self.min_x = min_x
-        self.min_y = min_y
-        self.max_x = max_x
-        self.max_y = max_y
-        self.dim_x = dim_x
-        self.dim_y = dim_y
-
-    @property
-    def x(self):
-        return self.min_x * self.dim_x
-
-    @property
-    def y(self):
-        return self.dim_y - self.max_y * self.dim_y
-
-    @property
-    def width(self):
-        return (self.max_x - self.min_x) * self.dim_x
-
-    @property
-    def height(self):
-        return (self.max_y - self.min_y) * self.dim_y
 
-    def __str__(self):
-        return "<Box, x=%i, y=%i, width=%i, height=%i>" % \
-            (self.x, self.y, self.width, self.height)
+def mesh_vertices(me_ob, depsgraph):
+    """
+    Read the evaluated vertices of a mesh object.
+
+    :arg me_ob: Mesh object.
+    :type me_ob: :class:`bpy.types.Object`
+    :arg depsgraph: Evaluated depsgraph of the scene.
+    :type depsgraph: :class:`bpy.types.Depsgraph`
+    :return: (N, 3) array of vertex coordinates in object space
+    :rtype: :class:`numpy.ndarray`
+    """
+    me = me_ob.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
 
-    def to_tuple(self):
-        if self.width == 0 or self.height == 0:
-            return 0, 0, 0, 0
-        return self.x, self.y, self.width, self.height
+    # float32 matches the vertex storage, so foreach_get is a plain buffer copy
+    n = len(me.vertices)
+    coords = np.empty(n * 3, dtype=np.float32)
+    me.vertices.foreach_get("co", coords)
+    me_ob.to_mesh_clear()
+    return coords.reshape(n, 3)
 
 
-def camera_view_bounds_2d(scene, cam_ob, me_ob):
+def camera_view_bounds_2d(coords, matrix_world, mat, frame, camera_persp):
     """
     Returns camera space bounding box of mesh object.
 
@@ -79,100 +67,116 @@ def camera_view_bounds_2d(scene, cam_ob, me_ob):
     Takes shift-x/y, lens angle and sensor size into account
     as well as perspective/ortho projections.
 
-    :arg scene: Scene to use for frame size.
-    :type scene: :class:`bpy.types.Scene`
-    :arg cam_ob: Camera object.
-    :type cam_ob: :class:`bpy.types.Object`
-    :arg me_ob: Untransformed Mesh.
-    :type me_ob: :class:`bpy.types.Mesh´
-    :return: a Box object (call to_tuple() method to get x, y, width and height)
-    :rtype: :class:`Box`
+    The camera values are the same for every object in a frame, so they are computed once per frame
+    by the caller. Only NumPy is used here, so it is safe to call outside of Blender's main thread.
+
+    :arg coords: Untransformed mesh vertices, see :func:`mesh_vertices`.
+    :type coords: :class:`numpy.ndarray`
+    :arg matrix_world: World matrix of the mesh object (4x4).
+    :type matrix_world: :class:`numpy.ndarray`
+    :arg mat: Inverted camera world matrix (4x4).
+    :type mat: :class:`numpy.ndarray`
+    :arg frame: First three corners of the camera view frame, negated (3x3).
+    :type frame: :class:`numpy.ndarray`
+    :arg camera_persp: Whether the camera uses a perspective projection.
+    :type camera_persp: bool
+    :return: min_x, min_y, max_x, max_y in normalized [0, 1] camera coordinates (y pointing up),
+        all zeros if the object is not visible
+    :rtype: tuple
     """
-    mat = cam_ob.matrix_world.normalized().inverted()
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    me = me_ob.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-
-    me.transform(me_ob.matrix_world)
-    me.transform(mat)
-
-    camera = cam_ob.data
-    frame = [-v for v in camera.view_frame(scene=scene)[:3]]
-    camera_persp = camera.type != 'ORTHO'
-
-    lx = []
-    ly = []
-
-    for v in me.vertices:
-        co_local = v.co
-        z = -co_local.z
-
-        if camera_persp:
-            if z == 0.0:
-                lx.append(0.5)
-                ly.append(0.5)
-            else:
-                frame = [(v / (v.z / z)) for v in frame]
-
-        min_x, max_x = frame[1].x, frame[2].x
-        min_y, max_y = frame[0].y, frame[1].y
-        x = (co_local.x - min_x) / (max_x - min_x)
-        y = (co_local.y - min_y) / (max_y - min_y)
-
-        lx.append(x)
-        ly.append(y)
-        center_x = clamp((max(lx) + min(lx)) / 2, 0., 1.)
-        center_y = clamp((max(ly) + min(ly)) / 2, 0., 1.)
-
-        bad_bbox = False
-        if center_x in (0., 1.) and center_y in (0., 1.):
-            bad_bbox = True
-        if min(lx) <= 0 and max(lx) >= 1:
-            bad_bbox = True
-        if min(ly) <= 0 and max(ly) >= 1:
-            bad_bbox = True
-
-        if bad_bbox:
+    if not len(coords):
+        return 0., 0., 0., 0.
+
+    # move vertices to camera space in a single pass
+    M = mat @ matrix_world
+    coords = np.matmul(coords, M[:3, :3].T) + M[:3, 3]
+
+    min_x, max_x = frame[1, 0], frame[2, 0]
+    min_y, max_y = frame[0, 1], frame[1, 1]
+
+    if camera_persp:
+        # scale the view frame to the depth of each vertex
+        z = -coords[:, 2]
+        scale = z / frame[0, 2]
+        min_x, max_x = min_x * scale, max_x * scale
+        min_y, max_y = min_y * scale, max_y * scale
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lx = (coords[:, 0] - min_x) / (max_x - min_x)
+        ly = (coords[:, 1] - min_y) / (max_y - min_y)
+
+    if camera_persp:
+        lx[z == 0.0] = 0.5
+        ly[z == 0.0] = 0.5
+
+    lx_min, lx_max = lx.min(), lx.max()
+    ly_min, ly_max = ly.min(), ly.max()
+
+    center_x = np.clip((lx_max + lx_min) / 2, 0., 1.)
+    center_y = np.clip((ly_max + ly_min) / 2, 0., 1.)
+
+    bad_bbox = False
+    if center_x in (0., 1.) and center_y in (0., 1.):
+        bad_bbox = True
+    if lx_min <= 0 and lx_max >= 1:
+        bad_bbox = True
+    if ly_min <= 0 and ly_max >= 1:
+        bad_bbox = True
+
+    if bad_bbox:
+        min_x = max_x = min_y = max_y = 0.
+    else:
+        min_x, max_x = np.clip((lx_min, lx_max), 0.0, 1.0)
+        min_y, max_y = np.clip((ly_min, ly_max), 0.0, 1.0)
+        if min_x == max_x or min_y == max_y:
             min_x = max_x = min_y = max_y = 0.
-        else:
-            min_x = clamp(min(lx), 0.0, 1.0)
-            max_x = clamp(max(lx), 0.0, 1.0)
-            min_y = clamp(min(ly), 0.0, 1.0)
-            max_y = clamp(max(ly), 0.0, 1.0)
-
-        r = scene.render
-        fac = r.resolution_percentage * 0.01
-        dim_x = r.resolution_x * fac
-        dim_y = r.resolution_y * fac
-        return Box(min_x, min_y, max_x, max_y, dim_x, dim_y)
 
+    return min_x, min_y, max_x, max_y
 
-def clamp(x, minimum, maximum):
-    return max(minimum, min(x, maximum))
 
+def write_bounds_2d(coords, matrix_world, mat, frame, camera_persp):
+    """
+    Compute the YOLO label line of a mesh object.
 
-def write_bounds_2d(scene, cam_ob, me_ob, cur_frame):
-    bpy.context.scene.frame_set(cur_frame)
-    box = camera_view_bounds_2d(scene, cam_ob, me_ob).to_tuple()
-    if np.count_nonzero(np.array(box)) != 0:
-        return box
+    :return: encoded "<class> <x_center> <y_center> <width> <height>" line normalized to the frame size,
+        or None if the object is not visible
+    """
+    min_x, min_y, max_x, max_y = camera_view_bounds_2d(coords, matrix_world, mat, frame, camera_persp)
+    width = max_x - min_x
+    height = max_y - min_y
+    if width and height:
+        x_center = (min_x + max_x) / 2
+        y_center = 1 - (min_y + max_y) / 2
+        return f"0 {x_center} {y_center} {width} {height}\n".encode()
     else:
         return None
 
 
-def normalize(data, frame_width, frame_height):
+def frame_labels(objects, mat, frame, camera_persp):
+    """
+    Compute the label file content of a single frame.
+
+    :param objects: list of (coords, matrix_world) pairs of the labeled objects in this frame.
+    :return: encoded label file
+    """
+    lines = []
+    for coords, matrix_world in objects:
+        data = write_bounds_2d(coords, matrix_world, mat, frame, camera_persp)
+
+        if data:
+            lines.append(data)
+    return b"".join(lines)
+
+
+def write_labels(labels):
     """
-    Normalize the bounding box coordinates relative to the frame size.
+    Write a batch of label files.
 
-    :param data: The bounding box coordinates [x, y, width, height].
-    :param frame_width: The width of the frame.
-    :param frame_height: The height of the frame.
-    :return: The normalized bounding box coordinates [x_center, y_center, width, height].
+    :param labels: list of (path, future) pairs, the future resolving to the encoded label file.
     """
-    x_center = (data[0] + data[2] / 2) / frame_width
-    y_center = (data[1] + data[3] / 2) / frame_height
-    width = data[2] / frame_width
-    height = data[3] / frame_height
-    return x_center, y_center, width, height
+    for label_filepath, content in labels:
+        with open(label_filepath, 'wb') as f:
+            f.write(content.result())
 
 
 def main(context, project_dir: str, frame_start: int, frame_end: int, tilt_angle: float, altitude: float, FOV: float):
@@ -320,28 +324,47 @@ def main(context, project_dir: str, frame_start: int, frame_end: int, tilt_angle
         if obj.name.startswith("obj"):
             labeled_objects_names.append(obj.name)
 
-    frame_width = scene.render.resolution_x
-    frame_height = scene.render.resolution_y
-
-    for frame_current in range(frame_start, frame_end):
-        all_data = ""
+    labeled_objects = [bpy.data.objects[name] for name in labeled_objects_names]
 
-        # iterate over each labeled object
-        for label in labeled_objects_names:
-            me_ob = bpy.data.objects.get(label)
+    # the labeled meshes are static, only their world matrix is read per frame
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    labeled_vertices = [mesh_vertices(me_ob, depsgraph) for me_ob in labeled_objects]
 
-            data = write_bounds_2d(scene, camera, me_ob, frame_current)
+    camera_persp = camera.data.type != 'ORTHO'
+    labels_prefix = os.path.join(labels_dir, "frame_")
 
-            if data:
-                x_center, y_center, width, height = normalize(data, frame_width, frame_height)
-                all_data += f"0 {x_center} {y_center} {width} {height}\n"
+    # bpy is single-threaded, so frames are evaluated and matrices read here, while the projection runs
+    # on worker threads and label files are written in batches on a background thread
+    pending_labels = []
+    writes = []
+    with ThreadPoolExecutor() as label_pool, ThreadPoolExecutor(max_workers=1) as label_writer:
+        for frame_current in range(frame_start, frame_end):
             scene.frame_set(frame_current)
 
-        # save label
-        frame_current_str = str(frame_current).zfill(4)
-        label_filepath = os.path.join(labels_dir, f'frame_{frame_current_str}.txt')
-        with open(label_filepath, 'w') as data:
-            data.write(str(all_data))
+            # camera values shared by all objects in this frame
+            mat = np.array(camera.matrix_world.normalized().inverted())
+            frame = np.array([[-v.x, -v.y, -v.z] for v in camera.data.view_frame(scene=scene)[:3]])
+
+            objects = [(coords, np.array(me_ob.matrix_world))
+                       for coords, me_ob in zip(labeled_vertices, labeled_objects)]
+
+            # save label
+            label_filepath = f"{labels_prefix}{frame_current:04d}.txt"
+            labels = label_pool.submit(frame_labels, objects, mat, frame, camera_persp)
+            pending_labels.append((label_filepath, labels))
+            if len(pending_labels) >= LABELS_FLUSH_SIZE:
+                # keep at most two batches in flight to bound the queued work
+                if writes:
+                    writes[-1].result()
+                writes.append(label_writer.submit(write_labels, pending_labels))
+                pending_labels = []
+
+        if pending_labels:
+            writes.append(label_writer.submit(write_labels, pending_labels))
+
+    # surface any write errors
+    for write in writes:
+        write.result()
 
     objects_count = len(labeled_objects_names)
     data = {
@@ -0,0 +1,91 @@
+import argparse
+import json
+
+from pathlib import Path
+from ultralytics import YOLO
+
+# upper bound on the metadata length prefix, anything larger means the engine has no metadata
+ENGINE_METADATA_MAX_SIZE = 1 << 20
+
+
+def engine_batch(engine):
+    """
+    Read the largest batch size an engine was exported with from the metadata Ultralytics stores in front of it.
+
+    :param engine: TensorRT engine path.
+    :return: The exported batch size, or None if the engine has no readable metadata.
+    """
+    try:
+        with open(engine, 'rb') as f:
+            meta_len = int.from_bytes(f.read(4), byteorder="little", signed=True)
+            if not 0 < meta_len < ENGINE_METADATA_MAX_SIZE:
+                return None
+            return int(json.loads(f.read(meta_len).decode())["batch"])
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def engine_path(model_path, batch_size=1):
+    """
+    Get the model to load, preferring a TensorRT engine exported next to the given model.
+
+    An engine older than the model is ignored, since it was exported from older weights.
+
+    :param model_path: YOLOv8 model path.
+    :param batch_size: The number of images that will be passed to the model at once.
+    :return: The path of the exported engine if it can be used, the given model path otherwise.
+    """
+    model_path = Path(model_path)
+    engine = model_path.with_suffix(".engine")
+    if engine == model_path or not engine.exists():
+        return model_path
+
+    if model_path.exists() and engine.stat().st_mtime < model_path.stat().st_mtime:
+        print(f"Ignoring {engine}: it is older than {model_path}, re-run export_model.py to update it")
+        return model_path
+
+    exported_batch = engine_batch(engine)
+    if exported_batch is not None and batch_size > exported_batch:
+        raise ValueError(f"{engine} was exported for batches of at most {exported_batch} images, "
+                         f"but the batch size is {batch_size}. Lower the batch size or re-run export_model.py "
+                         f"with --batch_size={batch_size}")
+
+    print(f"Using TensorRT engine {engine} instead of {model_path}")
+    return engine
+
+
+def export_model(model_path, data=None, batch_size=16, imgsz=640):
+    """
+    Export the model to a TensorRT engine saved next to it, which label_images.py and label_video.py then pick up.
+
+    :param model_path: YOLOv8 model path to be exported.
+    :param data: Dataset yaml used for INT8 calibration. Without it the engine is exported in half precision.
+    :param batch_size: The largest number of images passed to the engine at once.
+    :param imgsz: The input image size of the engine.
+    :return: The path of the exported engine.
+    """
+    model = YOLO(model_path)
+    int8 = data is not None
+    return model.export(format="engine", int8=int8, half=not int8, data=data,
+                        dynamic=True, batch=batch_size, imgsz=imgsz)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="\"Export the model to a TensorRT engine\"")
+    parser.add_argument("-m", "--model",
+                        help="YOLOv8 model path to be exported.", required=True)
+    parser.add_argument("-d", "--data",
+                        help="Dataset yaml used for INT8 calibration. Without it the engine uses half precision.")
+    parser.add_argument("-b", "--batch_size",
+                        help="The largest number of images passed to the engine at once.", type=int, default=16)
+    parser.add_argument("--imgsz",
+                        help="The input image size of the engine.", type=int, default=640)
+
+    args = parser.parse_args()
+
+    model = Path(args.model)
+    data = args.data
+    batch_size = args.batch_size
+    imgsz = args.imgsz
+
+    export_model(model, data=data, batch_size=batch_size, imgsz=imgsz)
@@ -1,37 +1,81 @@
 import argparse
 import os
 import cv2
+import numpy as np
+import torch
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from ultralytics import YOLO
 
+from export_model import engine_path
 
-def label_images(image_directory, output_directory, model_path, conf=0.4, half=True):
+# YOLO label line: class x_center y_center width height
+LABEL_FORMAT = ["%d", "%.6f", "%.6f", "%.6f", "%.6f"]
+# side of the blank image used to warm up the model
+WARMUP_SIZE = 640
+# image files picked up from the image directory
+IMAGE_EXTENSIONS = {".bmp", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp"}
+
+
+def load_images(image_files, batch_size):
+    """
+    Decode the images in batches on a thread pool, reading the next batch ahead while the current one is processed.
+
+    Files that cannot be decoded are skipped with a warning.
+
+    :param image_files: The paths of the images to be loaded.
+    :param batch_size: The number of images in a batch.
+    :return: A generator of (image_files, images) batches.
+    """
+    batches = [image_files[i:i + batch_size] for i in range(0, len(image_files), batch_size)]
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as loader:
+        pending = [loader.submit(cv2.imread, str(f)) for f in batches[0]] if batches else []
+        for i, batch_files in enumerate(batches):
+            loaded = [(f, image.result()) for f, image in zip(batch_files, pending)]
+            if i + 1 < len(batches):
+                pending = [loader.submit(cv2.imread, str(f)) for f in batches[i + 1]]
+
+            for f, image in loaded:
+                if image is None:
+                    print(f"Skipping {f}: the image cannot be read")
+            loaded = [(f, image) for f, image in loaded if image is not None]
+            if loaded:
+                yield [f for f, _ in loaded], [image for _, image in loaded]
+
+
+def label_images(image_directory, output_directory, model_path, conf=0.4, half=True, batch_size=16, use_engine=True):
     """
     Label the images in the given directory using the provided model and save the results in the output directory in txt format.
 
     :param image_directory: The directory path containing the images to be labeled.
     :param output_directory: The directory path where the labeled results will be saved.
-    :param model_path: YOLOv8 model used for labeling the images.
+    :param model_path: YOLOv8 model used for labeling the images. An up to date engine exported with export_model.py is used if present.
     :param conf: The confidence threshold for the bounding boxes.
     :param half: Whether to use half precision for the model.
+    :param batch_size: The number of images passed to the model at once.
+    :param use_engine: Whether to use the engine exported next to the model when there is one.
     :return: None
     """
-    model = YOLO(model_path)
+    model_file = engine_path(model_path, batch_size) if use_engine else model_path
+    model = YOLO(model_file)
+    # on the GPU, run a full blank batch first so kernel setup for the batched input shape is not paid on the
+    # first real batch; there is nothing to set up on the CPU, where it would only cost batch_size inferences
+    if Path(model_file).suffix == ".engine" or torch.cuda.is_available():
+        blank = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+        model.predict([blank] * batch_size, conf=conf, half=half, verbose=False)
     output_directory.mkdir(exist_ok=True)
 
-    for image_file in os.listdir(image_directory):
-        img = cv2.imread(os.path.join(image_directory, image_file))
-        filename, _ = os.path.splitext(image_file)
-        results = model(img, conf=conf, half=half)
+    image_files = sorted(f for f in Path(image_directory).iterdir() if f.suffix.lower() in IMAGE_EXTENSIONS)
+    for batch_files, images in load_images(image_files, batch_size):
+        results = model.predict(images, conf=conf, half=half, stream=True, verbose=False)
 
-        with open(output_directory / (filename + ".txt"), 'w') as f:
-            for result in results:
-                for box in result.boxes:
-                    cls = int(box.cls[0])
-                    x, y, w, h = box.xywhn[0]
-                    line = f'{cls} {x} {y} {w} {h}\n'
-                    f.write(line)
+        for image_file, result in zip(batch_files, results):
+            boxes = result.boxes
+            cls = boxes.cls.cpu().numpy()[:, None]
+            xywhn = boxes.xywhn.cpu().numpy()
+            labels = np.concatenate([cls, xywhn], axis=1)
+            np.savetxt(output_directory / (image_file.stem + ".txt"), labels, fmt=LABEL_FORMAT)
 
 
 if __name__ == '__main__':
@@ -46,6 +90,10 @@ if __name__ == '__main__':
                         help="The confidence threshold for the bounding boxes.", type=float, default=0.4)
     parser.add_argument("--half",
                         help="Whether to use half precision for the model.", action='store_true')
+    parser.add_argument("-b", "--batch_size",
+                        help="The number of images passed to the model at once.", type=int, default=16)
+    parser.add_argument("--no_engine",
+                        help="Use the given model even if an exported engine is found next to it.", action='store_true')
 
     args = parser.parse_args()
 
@@ -54,5 +102,8 @@ if __name__ == '__main__':
     model = Path(args.model)
     conf = args.conf
     half = args.half
+    batch_size = args.batch_size
+    use_engine = not args.no_engine
 
-    label_images(image_directory, output_directory, model, conf=conf, half=half)
+    label_images(image_directory, output_directory, model, conf=conf, half=half, batch_size=batch_size,
+                 use_engine=use_engine)
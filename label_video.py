@@ -1,10 +1,80 @@
 import argparse
 import os
+import queue
+import subprocess
+import threading
 import cv2
 
 from pathlib import Path
 from ultralytics import YOLO
 
+from export_model import engine_path
+
+
+# maximum number of frames buffered between the decoding, inference and encoding stages
+FRAME_QUEUE_SIZE = 32
+
+BOX_COLOR = (255, 255, 0)
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_SCALE = 0.4
+
+
+class FFmpegWriter:
+    """
+    Video writer piping raw frames to an ffmpeg process that encodes H.264 on the GPU with NVENC.
+
+    It has the same write/release interface as cv2.VideoWriter.
+    """
+
+    def __init__(self, path, fps, size, codec="h264_nvenc", bitrate="8M"):
+        width, height = size
+        self.path = path
+        self.codec = codec
+        self.process = subprocess.Popen(["ffmpeg", "-y", "-loglevel", "error",
+                                         "-f", "rawvideo", "-pix_fmt", "bgr24",
+                                         "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                                         "-c:v", codec, "-b:v", bitrate, "-pix_fmt", "yuv420p",
+                                         str(path)],
+                                        stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(frame.tobytes())
+        except BrokenPipeError as e:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.wait()} while encoding {self.path} "
+                               f"with {self.codec}") from e
+
+    def release(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {returncode} while encoding {self.path} with {self.codec}")
+
+
+def draw_detections(image, result, names):
+    """
+    Draw the bounding boxes and labels of a detection result on an image.
+
+    :param image: The input image to draw boxes on.
+    :param result: The YOLOv8 result for the image.
+    :param names: The class names of the model.
+
+    :return: The image with bounding boxes and labels drawn.
+    """
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy().astype(int)
+    classes = boxes.cls.cpu().numpy().astype(int)
+    confs = boxes.conf.cpu().numpy()
+
+    for (x1, y1, x2, y2), cls, conf in zip(xyxy.tolist(), classes.tolist(), confs.tolist()):
+        cv2.rectangle(image, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        label = f'{names[cls]} {conf:.2f}'
+        cv2.putText(image, label, (x1, y1 - 10), LABEL_FONT, LABEL_SCALE, BOX_COLOR, 1)
+    return image
+
 
 def draw_boxes(image, model, conf=0.4, half=True):
     """
@@ -17,54 +87,135 @@ def draw_boxes(image, model, conf=0.4, half=True):
 
     :return: The image with bounding boxes and labels drawn.
     """
-    results = model(image, conf=conf, half=half)
+    results = model(image, conf=conf, half=half, verbose=False)
     for result in results:
-        for box in result.boxes:
-            cls = int(box.cls[0])
-            conf = box.conf[0]
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            cv2.rectangle(image, (x1, y1), (x2, y2), (255, 255, 0), 2)
-            label = f'{model.names[cls]} {conf:.2f}'
-            cv2.putText(image, label, (x1, y1 - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.4,
-                        (255, 255, 0),
-                        1)
+        draw_detections(image, result, model.names)
     return image
 
 
-def label_video(video_path, output_directory, model_path, conf=0.4, half=True):
+def read_frames(video, frames, stop, errors):
+    """
+    Decode the frames of a video into a queue, followed by None once the video ends or stop is set.
+
+    :param video: The opened cv2.VideoCapture.
+    :param frames: The queue receiving the decoded frames.
+    :param stop: The event telling the reader to stop early.
+    :param errors: The list collecting the exceptions raised by the pipeline threads.
+    """
+    try:
+        while not stop.is_set():
+            ret, frame = video.read()
+
+            if not ret:
+                break
+
+            frames.put(frame)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        frames.put(None)
+
+
+def write_frames(out, names, detections, errors):
+    """
+    Draw the detections on their frames and encode them until None is received.
+
+    After an error the remaining items are discarded, so the producer never blocks on a full queue.
+
+    :param out: The opened cv2.VideoWriter.
+    :param names: The class names of the model.
+    :param detections: The queue providing (frame, result) pairs.
+    :param errors: The list collecting the exceptions raised by the pipeline threads.
+    """
+    while True:
+        item = detections.get()
+
+        if item is None:
+            break
+
+        if errors:
+            continue
+
+        try:
+            frame, result = item
+            out.write(draw_detections(frame, result, names))
+        except Exception as e:
+            errors.append(e)
+
+
+def label_video(video_path, output_directory, model_path, conf=0.4, half=True, batch_size=8, nvenc=False, use_engine=True):
     """
     Label the video in the given path using the provided model and save the results in the output directory.
 
+    Decoding and encoding run on their own threads, so they overlap with the inference.
+
     :param video_path: The path of the video to be labeled.
     :param output_directory: The directory path where the labeled results will be saved.
-    :param model_path: YOLOv8 model path used for labeling the video.
+    :param model_path: YOLOv8 model path used for labeling the video. An up to date engine exported with export_model.py is used if present.
     :param conf: The confidence threshold for the bounding boxes.
     :param half: Whether to use half precision for the model.
+    :param batch_size: The number of frames passed to the model at once.
+    :param nvenc: Whether to encode the output as H.264 with NVENC through ffmpeg instead of OpenCV's mp4v.
+    :param use_engine: Whether to use the engine exported next to the model when there is one.
     :return: None
     """
-    model = YOLO(model_path)
+    model = YOLO(engine_path(model_path, batch_size) if use_engine else model_path)
     video = cv2.VideoCapture(str(video_path))
     width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = video.get(cv2.CAP_PROP_FPS)
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(str(output_directory / (os.path.basename(video_path) + ".mp4")), fourcc, fps, (width, height))
-
-    while True:
-        ret, frame = video.read()
-
-        if not ret:
-            break
-
-        frame = draw_boxes(frame, model, conf=conf, half=half)
-
-        out.write(frame)
-
-    video.release()
-    out.release()
+    output_path = output_directory / (os.path.basename(video_path) + ".mp4")
+    if nvenc:
+        out = FFmpegWriter(output_path, fps, (width, height))
+    else:
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    detections = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+    reader = threading.Thread(target=read_frames, args=(video, frames, stop, errors), daemon=True)
+    writer = threading.Thread(target=write_frames, args=(out, model.names, detections, errors), daemon=True)
+    reader.start()
+    writer.start()
+
+    try:
+        batch = []
+        while not errors:
+            frame = frames.get()
+
+            if frame is not None:
+                batch.append(frame)
+
+            if batch and (frame is None or len(batch) == batch_size):
+                results = model(batch, conf=conf, half=half, verbose=False)
+                for batch_frame, result in zip(batch, results):
+                    detections.put((batch_frame, result))
+                batch = []
+
+            if frame is None:
+                break
+    finally:
+        # the writer keeps consuming after an error, so this never blocks
+        detections.put(None)
+        writer.join()
+
+        # unblock the reader if it is waiting on a full queue
+        stop.set()
+        while reader.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader.join()
+
+        video.release()
+        out.release()
+
+    if errors:
+        raise errors[0]
 
 
 if __name__ == '__main__':
@@ -79,6 +230,12 @@ if __name__ == '__main__':
                         help="The confidence threshold for the bounding boxes.", type=float, default=0.4)
     parser.add_argument("--half",
                         help="Whether to use half precision for the model.", action='store_true')
+    parser.add_argument("-b", "--batch_size",
+                        help="The number of frames passed to the model at once.", type=int, default=8)
+    parser.add_argument("--nvenc",
+                        help="Whether to encode the video as H.264 on the GPU with ffmpeg and NVENC.", action='store_true')
+    parser.add_argument("--no_engine",
+                        help="Use the given model even if an exported engine is found next to it.", action='store_true')
 
     args = parser.parse_args()
 
@@ -87,5 +244,9 @@ if __name__ == '__main__':
     model = Path(args.model)
     conf = args.conf
     half = args.half
+    batch_size = args.batch_size
+    nvenc = args.nvenc
+    use_engine = not args.no_engine
 
-    label_video(video_path, output_directory, model, conf=conf, half=half)
+    label_video(video_path, output_directory, model, conf=conf, half=half, batch_size=batch_size, nvenc=nvenc,
+                use_engine=use_engine)